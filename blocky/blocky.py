@@ -1,7 +1,10 @@
-#!/usr/bin/env python2.7
+#!/usr/bin/env python3
 
-import commands
 import contextlib
+import errno
+import ipaddress
+import shlex
+import shutil
 import sys
 import subprocess
 import time
@@ -12,10 +15,12 @@ import os
 import logging
 import logging.handlers
 import psutil
-from ConfigParser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
 from dns import resolver
-from dns.resolver import NXDOMAIN
-from iptc import Rule, Table
+from dns.exception import DNSException
+from pyroute2 import IPSet
+from pyroute2.netlink.exceptions import NetlinkError
 from setproctitle import setproctitle
 
 ips = []
@@ -28,6 +33,9 @@ proc_title = 'blocky.py'
 
 whitelist_ipset_name = 'blocky_local_ip_whitelist'
 
+# longest set name the kernel accepts (IPSET_MAXNAMELEN minus the terminating NUL)
+ipset_name_maxlen = 31
+
 run_foreground = False
 
 # Exceptions
@@ -48,6 +56,10 @@ class IPSetError(BlockIPError):
     pass
 
 
+class IPTablesError(BlockIPError):
+    pass
+
+
 class ConfigFileNotFound(Exception):
     pass
 
@@ -56,6 +68,10 @@ class IncorrectCheckEvery(Exception):
     pass
 
 
+class IncorrectMaxCheck(Exception):
+    pass
+
+
 class IncorrectRulePosition(Exception):
     pass
 
@@ -77,24 +93,38 @@ class LogPathUnset(Exception):
 
 # Utilities
 
-def flatten(lst):
-    flat = []
-    for x in lst:
-        if hasattr(x, '__iter__') and not isinstance(x, basestring):
-            flat.extend(flatten(x))
-        else:
-            flat.append(x)
-    return flat
-
-
 def parse_comma_separated(s):
     return [x.strip() for x in s.split(',')]
 
 
+def split_networks(entries):
+    # entries in CIDR notation are IPv4 networks, everything else is a name or an address
+    names, networks = [], []
+    for x in entries:
+        if '/' not in x:
+            names.append(x)
+            continue
+        try:
+            net = ipaddress.ip_network(x, strict=False)
+        except ValueError:
+            log.warning('Ignoring %s: not a valid network', x)
+            continue
+        if net.version != 4:
+            log.warning('Ignoring %s: only IPv4 networks are supported', x)
+            continue
+        networks.append(str(net))
+    return names, networks
+
+
+def backoff_delay(check_every, max_check, stable_ticks):
+    # double the delay for every check without changes, up to max_check
+    return min(max_check, check_every * (2 ** min(stable_ticks, 6)))
+
+
 @contextlib.contextmanager
 def pidfile_ctxmgr(pidfile_path):
     pid = os.getpid()
-    with open(pidfile_path, 'wb') as fo:
+    with open(pidfile_path, 'w') as fo:
         fo.write(str(pid))
     yield
     try:
@@ -182,26 +212,51 @@ class DetectIPAddresses(object):
     def __init__(self, fqdns=None):
         if fqdns is None:
             fqdns = []
-        self.fqdns = fqdns
+        # CIDR entries are blocked as they are, everything else is resolved
+        self.fqdns, self.networks = split_networks(fqdns)
         self._rslv = resolver.Resolver()
+        self._rslv.lifetime = 2.0
+        self._rslv.timeout = 1.0
+        self.max_workers = 32
+        self._cache = {}
+        self.stale_ttl = 86400
 
     def _resolve_catch_err(self, fqdn):
+        entry = self._cache.get(fqdn)
+        now = time.monotonic()
+        if entry and entry[1] > now:
+            return entry[0]
         try:
-            return self._rslv.query(fqdn, 'A')
-        except NXDOMAIN:
-            pass
+            answers = self._rslv.resolve(fqdn, 'A')
+            # expiration is the lowest TTL across the whole CNAME chain, not just the final A rrset
+            expiry = time.monotonic() + max(0, answers.expiration - time.time())
+            self._cache[fqdn] = (answers, expiry, expiry + self.stale_ttl)
+            return answers
+        except DNSException as e:
+            # serve stale (RFC 8767): keep blocking last known addresses while the resolver fails
+            if entry and entry[2] > now:
+                log.warning('Resolving %s failed (%s), using stale addresses', fqdn, e.__class__.__name__)
+                return entry[0]
+            log.warning('Resolving %s failed (%s)', fqdn, e.__class__.__name__)
+            self._cache.pop(fqdn, None)
         return []
 
+    def _resolve_all(self):
+        if not self.fqdns:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.fqdns))) as ex:
+            return list(ex.map(self._resolve_catch_err, self.fqdns))
+
     def iplist(self):
         log.debug('FQDNs: %s', self.fqdns)
-        resolver = self._resolve_catch_err
-        addresses = filter(None, flatten([list(resolver(fqdn)) for fqdn in self.fqdns]))
-        addresses = list(set([x.address for x in addresses]))
-        addresses.sort()
-        return addresses
+        addresses = {rdata.address for answers in self._resolve_all() for rdata in answers}
+        addresses.update(self.networks)
+        return sorted(addresses)
 
 
 class IPTablesHandler(object):
+    tables = ('filter', 'nat', 'mangle', 'raw', 'security')
+
     def __init__(self, table_name='FILTER', chain_name='FORWARD', ipset_name='blocky', match_set_flag='src', rule_pos=0,
                  comment='Blocky IPTables Rule', target='DROP'):
         self.chain_name = chain_name
@@ -211,106 +266,187 @@ class IPTablesHandler(object):
         self.chain = None
         self.table = None
         self.rule = None
+        self._inserted_rule = None
         self.rule_pos = rule_pos
         self._comment = comment
         self.match_set_flag = match_set_flag
+        self.path = os.environ.get('PATH', '/sbin:/bin:/usr/sbin:/usr/bin')
         self._table_find()
         self._chain_find()
         self._rule_find()
 
+    def _env(self):
+        return {'PATH': self.path, 'LC_ALL': 'C'}
+
+    def _run(self, cmds, stdin=None):
+        p = subprocess.Popen(cmds, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=self._env(), text=True)
+        so, se = p.communicate(stdin)
+        if p.returncode:
+            raise IPTablesError(se)
+        return so
+
+    def _save(self):
+        return self._run(['iptables-save', '-t', self.table]).splitlines()
+
+    def _restore(self, lines):
+        script = '*{}\n{}\nCOMMIT\n'.format(self.table, '\n'.join(lines))
+        log.debug('iptables-restore: %s', script)
+        self._run(['iptables-restore', '-n'], stdin=script)
+
     def _table_find(self):
-        try:
-            self.table = Table(getattr(Table, self.table_name))
-        except AttributeError as e:
+        table = self.table_name.strip().lower()
+        if table not in self.tables:
             raise TableNotFound(self.table_name)
+        self.table = table
 
     def _chain_find(self):
-        chains = filter(lambda c: c.name == self.chain_name, self.table.chains)
-        try:
-            self.chain = chains[0]
-        except IndexError:
+        chains = (line[1:].split()[0] for line in self._save() if line.startswith(':'))
+        self.chain = next((c for c in chains if c == self.chain_name), None)
+        if self.chain is None:
             raise ChainNotFound(self.chain_name)
 
     def rules(self):
         if not self.chain:
             self._chain_find()
-        return self.chain.rules
+        prefix = '-A {} '.format(self.chain)
+        return [line for line in self._save() if line.startswith(prefix)]
+
+    def _rule_comment(self, rule):
+        args = shlex.split(rule)
+        if '--comment' in args:
+            return args[args.index('--comment') + 1]
+
+    def _rule_spec(self):
+        return '-p tcp -m comment --comment "{}" -m set --match-set {} {} -j {}'.format(
+            self._comment, self.ipset_name, self.match_set_flag, self.target)
 
     def insert_rule(self):
         if not self.rule:
-            rule = Rule()
-            rule.protocol = 'tcp'
-            rule.target = rule.create_target(self.target)
-            match = rule.create_match('comment')
-            match.comment = self._comment
-
-            match = rule.create_match('set')
-            match.match_set = [self.ipset_name, self.match_set_flag]
-            self.rule = rule
+            spec = self._rule_spec()
             log.info(
                 '''Inserting a rule with target %s into chain %s (table %s) for ipset "%s" (with comment "%s", rule position: %s)''',
                 self.target, self.chain_name, self.table_name, self.ipset_name, self._comment, self.rule_pos)
-            self.chain.insert_rule(rule, position=self.rule_pos)
+            # iptables rule numbers start at 1
+            self._restore(['-I {} {} {}'.format(self.chain, self.rule_pos + 1, spec)])
+            self.rule = '-A {} {}'.format(self.chain, spec)
+            self._inserted_rule = self.rule
 
     def delete_rule(self):
-        for rule in self.chain.rules:
-            for match in rule.matches:
-                if match.comment == self._comment:
-                    log.info('Deleting blocky IPTables rule (chain %s)', self.chain.name)
-                    self.chain.delete_rule(rule)
+        if self._inserted_rule:
+            # we know the exact spec of our own rule, no need to scan the chain for it
+            log.info('Deleting blocky IPTables rule (chain %s)', self.chain)
+            rule, self._inserted_rule = self._inserted_rule, None
+            try:
+                self._restore(['-D' + rule[2:]])
+                self.rule = None
+                return
+            except IPTablesError as e:
+                # already gone (chain flushed, firewall reloaded, ...), look for it by comment instead
+                log.debug('Deleting rule by spec failed: %s', e)
+        lines = ['-D' + rule[2:] for rule in self.rules() if self._rule_comment(rule) == self._comment]
+        if lines:
+            log.info('Deleting blocky IPTables rule (chain %s)', self.chain)
+            self._restore(lines)
+        self.rule = None
 
     def _rule_find(self):
         for rule in self.rules():
-            match_with_comment = filter(lambda m: m.comment == self._comment, rule.matches)
-            if match_with_comment:
+            if self._rule_comment(rule) == self._comment:
                 self.rule = rule
                 return rule
 
 
 class IPSetHandler(object):
-    def __init__(self, ipset_name='blocky_blacklist'):
+    def __init__(self, ipset_name='blocky_blacklist', networks=False):
         self.ipset_name = ipset_name
-        self.create_ipset_args = 'create {} hash:ip hashsize 4096'.format(self.ipset_name)
-        self.path = os.environ.get('PATH', '/sbin:/bin:/usr/sbin:/usr/bin')
-        self.iplist_prev = []
+        if networks:
+            self.create_ipset_args = {'stype': 'hash:net', 'hashsize': 262144, 'maxelem': 262144}
+            self.etype = 'net'
+        else:
+            self.create_ipset_args = {'stype': 'hash:ip', 'hashsize': 4096}
+            self.etype = 'ip'
+        self._ipset = IPSet()
+        self._prev_set = None
 
-    def _env(self):
-        return {'PATH': self.path, 'LC_ALL': 'C'}
+    def run_ipset_cmd(self, cmd, *args, **kwargs):
+        try:
+            return cmd(*args, **kwargs)
+        except NetlinkError as e:
+            raise IPSetError(e)
 
-    def run_ipset_cmd(self, cmds, msg_on_existing_ipset='', msg_on_creating_ipset=''):
-        p = subprocess.Popen(cmds, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self._env())
-        so, se = p.communicate()
-        if p.returncode:
-            if not so and se.find('set with the same name already exists') > -1:
-                log.info(msg_on_existing_ipset)
+    def existing_type(self):
+        try:
+            headers = list(self._ipset.headers(self.ipset_name))
+        except NetlinkError as e:
+            if e.code == errno.ENOENT:
+                return None
+            raise IPSetError(e)
+        if headers:
+            return headers[0].get_attr('IPSET_ATTR_TYPENAME')
+
+    def type_mismatch(self, stype):
+        return stype is not None and stype != self.create_ipset_args['stype']
+
+    def create_ipset(self, stype=None):
+        # stype is the type of an already existing set with this name, as returned by existing_type()
+        if self.type_mismatch(stype):
+            # sets of different types cannot be swapped, so the existing one has to be recreated
+            log.info('ipset %s exists with type %s, recreating it as %s', self.ipset_name, stype,
+                     self.create_ipset_args['stype'])
+            try:
+                self._ipset.destroy(self.ipset_name)
+            except NetlinkError as e:
+                raise IPSetError('ipset {} has type {} but {} is needed and it cannot be destroyed '
+                                 '(is it still referenced by an iptables rule?): {}'.format(
+                                     self.ipset_name, stype, self.create_ipset_args['stype'], e))
+        log.debug('Creating ipset: %s %s', self.ipset_name, self.create_ipset_args)
+        try:
+            self._ipset.create(self.ipset_name, **self.create_ipset_args)
+        except NetlinkError as e:
+            if e.code == errno.EEXIST:
+                log.info('ipset %s exists', self.ipset_name)
                 return
-            raise IPSetError(se)
-        if msg_on_creating_ipset:
-            log.info(msg_on_creating_ipset)
-
-    def create_ipset(self):
-        cmds = flatten(['ipset', self.create_ipset_args.split()])
-        log.debug('Creating ipset: %s', cmds)
-        self.run_ipset_cmd(cmds, msg_on_existing_ipset='ipset {} exists'.format(self.ipset_name),
-                           msg_on_creating_ipset='Creating ipset {}'.format(self.ipset_name))
+            raise IPSetError(e)
+        log.info('Creating ipset %s', self.ipset_name)
 
     def destroy_ipset(self):
-        cmds = ['ipset', 'destroy', self.ipset_name]
         log.info('Destroying ipset: %s', self.ipset_name)
-        self.run_ipset_cmd(cmds)
+        self.run_ipset_cmd(self._ipset.destroy, self.ipset_name)
+
+    def swap_ipset(self, ips):
+        # build the complete set aside and swap it in, so the live set is never seen empty
+        tmp_name = 'tmp_{}'.format(self.ipset_name)[:ipset_name_maxlen]
+        log.debug('Building ipset %s to swap with %s', tmp_name, self.ipset_name)
+        try:
+            self._ipset.destroy(tmp_name)
+        except NetlinkError as e:
+            if e.code != errno.ENOENT:
+                raise IPSetError(e)
+        self.run_ipset_cmd(self._ipset.create, tmp_name, **self.create_ipset_args)
+        for ip in ips:
+            self.run_ipset_cmd(self._ipset.add, tmp_name, ip, exclusive=False, etype=self.etype)
+        self.run_ipset_cmd(self._ipset.swap, self.ipset_name, tmp_name)
+        self.run_ipset_cmd(self._ipset.destroy, tmp_name)
 
     def update_ipset(self, iplist):
-        iplist.sort()
-        if iplist != self.iplist_prev:
-            log.info('Updating ipset %s with IP addresses: %s', self.ipset_name, ', '.join(map(str, iplist)))
-            cmds = flatten(['ipset', 'flush', self.ipset_name])
-            self.run_ipset_cmd(cmds)
-            log.debug(cmds)
-            for ip in iplist:
-                cmds = flatten(['ipset', 'add', self.ipset_name, str(ip)])
-                log.debug(cmds)
-                self.run_ipset_cmd(cmds)
-            self.iplist_prev = iplist
+        new = set(str(ip) for ip in iplist if ip)
+        if self._prev_set is not None:
+            if new == self._prev_set:
+                return
+            adds, dels = new - self._prev_set, self._prev_set - new
+        log.info('Updating ipset %s with IP addresses: %s', self.ipset_name, ', '.join(sorted(new)))
+        if self._prev_set is None:
+            # contents of a pre-existing set are unknown, resync it fully the first time
+            self.swap_ipset(new)
+        else:
+            if dels:
+                log.debug('Removing from ipset %s: %s', self.ipset_name, ', '.join(sorted(dels)))
+            for ip in dels:
+                self.run_ipset_cmd(self._ipset.delete, self.ipset_name, ip, exclusive=False, etype=self.etype)
+            for ip in adds:
+                self.run_ipset_cmd(self._ipset.add, self.ipset_name, ip, exclusive=False, etype=self.etype)
+        self._prev_set = new
 
 
 class Settings(dict):
@@ -320,7 +456,7 @@ class Settings(dict):
         super(Settings, self).__init__(**kwargs)
         self._config_file = config_file
         self._list_keys = ['domains']
-        self._mandatory_fields = mandatory_fields
+        self._mandatory_fields = frozenset(mandatory_fields)
         self._parse_config()
 
     def _parse_config(self):
@@ -332,32 +468,25 @@ class Settings(dict):
         for opt in cp.options('main'):
             val = cp.get('main', opt).strip()
             if val.startswith('@'):
-                val = self.check_opt_path(val)
+                val = self._load_file(val)
             elif opt in self._list_keys:
                 val = [x.strip() for x in val.split(',')]
-            # setattr(self, opt, val)
-            val = self.check_opt_path(val)
             self[opt] = val
             visited.add(opt)
-        diff = set(self._mandatory_fields) - visited
+        diff = self._mandatory_fields.difference(visited)
         if diff:
             log.error('Following mandatory option(s) are not set in config file %s: %s. Abort.', self._config_file,
-                      ', '.join(map(str, list(diff))))
+                      ', '.join(sorted(diff)))
             sys.exit(1)
 
-    def check_opt_path(self, val):
-        if isinstance(val, basestring):
-            val = val.strip()
-            fpath = None
-            if val:
-                fpath = val[1:].strip()
-            if val.startswith('@') and fpath and os.path.isfile(fpath):
-                log.info('Reading values from file %s', fpath)
-                with open(fpath, 'rb') as fo:
-                    values = [x.strip() for x in fo.readlines()]
-                    values = [x for x in values if x and (not x.startswith('#'))]
-                    return values
-        return val
+    def _load_file(self, val):
+        fpath = val[1:].strip()
+        if not (fpath and os.path.isfile(fpath)):
+            return val
+        log.info('Reading values from file %s', fpath)
+        with open(fpath, 'r') as fo:
+            stripped = (line.strip() for line in fo)
+            return [x for x in stripped if x and not x.startswith('#')]
 
 
 class StartupChecks(object):
@@ -370,6 +499,7 @@ class StartupChecks(object):
 
     def test_prereqs(self):
         self.check_int_check_every()
+        self.check_int_max_check()
         self.check_root()
         self.check_command_availability()
         self.check_table_and_chain()
@@ -378,21 +508,18 @@ class StartupChecks(object):
         self.check_rule_pos()
 
     def check_command_availability(self):
-        for cmd, args in [('iptables', '-L -n'), ('ipset', '-L -n')]:
-            status, err = commands.getstatusoutput('{} {}'.format(cmd, args))
-            if status:
-                print >> sys.stderr, 'ERROR command {} is missing or otherwise unavailable, exit status: {}, error: {}'.format(
-                    cmd, status, err)
-                sys.exit(status)
+        for cmd in ('iptables-save', 'iptables-restore'):
+            if shutil.which(cmd) is None:
+                print('ERROR command {} is missing or otherwise unavailable'.format(cmd), file=sys.stderr)
+                sys.exit(1)
 
     def check_root(self):
         if os.geteuid():
-            print >> sys.stderr, 'This program has to be ran by root. Abort.'
+            print('This program has to be ran by root. Abort.', file=sys.stderr)
             sys.exit(1)
 
     def check_table_and_chain(self):
         self.th = IPTablesHandler(table_name=self.table_name, chain_name=self.chain_name)
-        self.th._chain_find()
 
     def check_int_check_every(self):
         cev = self.settings.get('check_every')
@@ -404,6 +531,17 @@ class StartupChecks(object):
             raise IncorrectCheckEvery(cev)
         self.settings['check_every'] = cev
 
+    def check_int_max_check(self):
+        cev = self.settings['check_every']
+        mch = self.settings.get('max_check', cev)
+        try:
+            mch = int(mch)
+        except ValueError:
+            raise IncorrectMaxCheck(mch)
+        if mch < cev:
+            raise IncorrectMaxCheck(mch)
+        self.settings['max_check'] = mch
+
     def check_rule_pos_setting(self):
         rpos = self.settings.get('rule_pos', 0)
         msg = 'Incorrect rule position (rule_pos setting, set currently to: {}). Abort.'.format(rpos)
@@ -431,7 +569,7 @@ class StartupChecks(object):
                 pid_exists = psutil.pid_exists(pid)
                 proc = psutil.Process(pid)
                 if pid_exists and proc.name() == 'blocky.py':
-                    log.warn('blocky appears to run in process %s. Killing it.', pid)
+                    log.warning('blocky appears to run in process %s. Killing it.', pid)
                     os.kill(pid, signal.SIGTERM)
                     return
                 if pid_exists:
@@ -458,8 +596,10 @@ class BlockManager(object):
     def run(self):
         init_rule_pos = int(self.settings.get('rule_pos', 0))
         # Local IP Whitelist ipset
-        self.local_whitelist_ipset_handler = IPSetHandler(ipset_name=whitelist_ipset_name)
-        self.local_whitelist_ipset_handler.create_ipset()
+        whitelist_ips, whitelist_networks = split_networks(
+            parse_comma_separated(self.settings.get('whitelist_local_ips', '')))
+        self.local_whitelist_ipset_handler = IPSetHandler(ipset_name=whitelist_ipset_name,
+                                                          networks=bool(whitelist_networks))
         # Local IP Whitelist iptables rule
         self.local_whitelist_iptables_handler = IPTablesHandler(table_name=self.settings['table'],
                                                 chain_name=self.settings['chain'],
@@ -468,38 +608,54 @@ class BlockManager(object):
                                                 rule_pos=init_rule_pos,
                                                 comment='Blocky Whitelist IPTables Rule',
                                                 target='ACCEPT')
-        self.local_whitelist_iptables_handler.insert_rule()
-        self.local_whitelist_ipset_handler.update_ipset(iplist=parse_comma_separated(self.settings.get('whitelist_local_ips', '')))
+        self.setup_ipset_and_rule(self.local_whitelist_ipset_handler, self.local_whitelist_iptables_handler)
+        self.local_whitelist_ipset_handler.update_ipset(iplist=whitelist_ips + whitelist_networks)
         # Create blocking ipset
-        self.ipset_handler = IPSetHandler(ipset_name=self.settings['ipset'])
-        self.ipset_handler.create_ipset()
+        detect = DetectIPAddresses(fqdns=self.settings['domains'])
+        self.ipset_handler = IPSetHandler(ipset_name=self.settings['ipset'], networks=bool(detect.networks))
         # Insert blocking iptables rule
         self.iptables_handler = IPTablesHandler(table_name=self.settings['table'],
                                                 chain_name=self.settings['chain'],
                                                 ipset_name=self.settings['ipset'],
                                                 rule_pos=init_rule_pos+1)
-        self.iptables_handler.insert_rule()
-        delay = self.settings['check_every']
-        log.debug('check_every: %s', delay)
-        detect = DetectIPAddresses(fqdns=self.settings['domains'])
+        self.setup_ipset_and_rule(self.ipset_handler, self.iptables_handler)
+        check_every = self.settings['check_every']
+        max_check = self.settings.get('max_check', check_every)
+        log.debug('check_every: %s, max_check: %s', check_every, max_check)
         setproctitle(proc_title)
         self.log_startup_notice()
         cnt = 1
+        stable_ticks = 0
+        iplist_prev = None
         while True:
             iplist = detect.iplist()
             if cnt % 10 == 0:
                 log.info('Blocked IP addresses: %s', ', '.join(map(str, iplist)))
                 cnt = 0
             cnt += 1
-            self.ipset_handler.update_ipset(iplist)
+            # back off exponentially up to max_check while addresses stay the same
+            if iplist == iplist_prev:
+                stable_ticks += 1
+            else:
+                stable_ticks = 0
+                self.ipset_handler.update_ipset(iplist)
+            iplist_prev = iplist
+            delay = backoff_delay(check_every, max_check, stable_ticks)
+            log.debug('Next check in %s seconds', delay)
             time.sleep(delay)
 
+    def setup_ipset_and_rule(self, ipset_handler, iptables_handler):
+        stype = ipset_handler.existing_type()
+        if ipset_handler.type_mismatch(stype):
+            # a rule left over from an earlier run still references the set and would keep it from being destroyed
+            iptables_handler.delete_rule()
+        ipset_handler.create_ipset(stype)
+        iptables_handler.insert_rule()
+
     def log_startup_notice(self):
         log.info('blocky (Block-YouTube) startup. Settings:')
-        keys = self.settings.keys()
-        keys.sort()
         log.info('Config file: %s', self.settings._config_file)
-        for k in keys:
+        for k in sorted(self.settings):
             val = self.settings.get(k)
             if isinstance(val, list):
                 val = ', '.join(map(str, val))
@@ -535,9 +691,16 @@ class Main(object):
         except IPSetError as e:
             log.error('ipset problem: %s', e)
             sys.exit(5)
+        except IPTablesError as e:
+            log.error('iptables problem: %s', e)
+            sys.exit(12)
         except IncorrectCheckEvery as e:
             log.error('Incorrect check_every setting (%s) in config file. Abort.', e)
             sys.exit(6)
+        except IncorrectMaxCheck as e:
+            log.error('Incorrect max_check setting (%s) in config file, has to be an integer not lower than '
+                      'check_every. Abort.', e)
+            sys.exit(11)
         except IncorrectLogType as e:
             log.error('Incorrect log_type setting (%s) in config file. Abort.', e)
             sys.exit(7)
@@ -4,7 +4,8 @@ setup(
     name='blocky',
     version='0.1',
     packages=['blocky'],
-    install_requires=['dnspython', 'python-iptables', 'python-daemon', 'setproctitle', 'psutil'],
+    python_requires='>=3.11',
+    install_requires=['dnspython>=2.0', 'pyroute2', 'python-daemon', 'setproctitle', 'psutil'],
     url='https://github.com/mrkafk/block-youtube',
     license='MIT',
     author='Marcin Krol',
@@ -17,7 +18,8 @@ setup(
           'License :: OSI Approved :: MIT License',
           'Natural Language :: English',
           'Operating System :: POSIX :: Linux',
-          'Programming Language :: Python :: 2.7',
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3.11',
           'Topic :: System :: Systems Administration',
           'Topic :: Utilities',
     ],
@@ -1,10 +1,28 @@
 #!/usr/bin/env python
 
+import errno
 import unittest
 import sys
 import os
+from unittest import mock
 
-from blocky.blocky import DetectIPAddresses
+from dns.resolver import NXDOMAIN, NoAnswer
+from pyroute2.netlink.exceptions import NetlinkError
+
+from blocky.blocky import (BlockManager, DetectIPAddresses, IPSetHandler, IPTablesError, IPTablesHandler,
+                           backoff_delay, split_networks)
+
+IPTABLES_SAVE = """# Generated by iptables-save
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m comment --comment "Blocky Whitelist IPTables Rule" -m set --match-set wl dst -j ACCEPT
+-A INPUT -p tcp -m comment --comment "Blocky IPTables Rule" -m set --match-set blocky src -j DROP
+-A FORWARD -p tcp -m comment --comment "Blocky IPTables Rule" -m set --match-set blocky src -j DROP
+COMMIT
+"""
 
 
 class TestBlocky(unittest.TestCase):
@@ -14,5 +32,196 @@ class TestBlocky(unittest.TestCase):
         addr = det.iplist()
         self.assertEqual(addr, ['127.0.0.1'])
 
+    def test_detectipaddresses_networks(self):
+        det = DetectIPAddresses(fqdns=['192.0.2.0/24', '10.0.0.0/8'])
+        addr = det.iplist()
+        self.assertEqual(addr, ['10.0.0.0/8', '192.0.2.0/24'])
+
+    def test_detectipaddresses_invalid_networks(self):
+        det = DetectIPAddresses(fqdns=['youtube.com/watch', '10.0.0.0/33', '2001:db8::/32', '10.1.2.3/16'])
+        self.assertEqual(det.fqdns, [])
+        self.assertEqual(det.iplist(), ['10.1.0.0/16'])
+
+    def test_backoff_delay(self):
+        self.assertEqual(backoff_delay(120, 960, 0), 120)
+        self.assertEqual(backoff_delay(120, 960, 2), 480)
+        self.assertEqual(backoff_delay(120, 960, 5), 960)
+        self.assertEqual(backoff_delay(1, 10 ** 6, 100), 64)
+        self.assertEqual(backoff_delay(120, 120, 3), 120)
+
+
+class TestDNSCache(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('blocky.blocky.time')
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.monotonic.return_value = 1000.0
+        self.time.time.return_value = 5000.0
+        self.det = DetectIPAddresses(fqdns=['a.example'])
+        self.det._rslv = mock.Mock()
+
+    def _answers(self, ttl, *addresses):
+        answers = mock.MagicMock()
+        answers.expiration = self.time.time.return_value + ttl
+        answers.__iter__.return_value = [mock.Mock(address=a) for a in addresses]
+        return answers
+
+    def test_cached_until_ttl(self):
+        self.det._rslv.resolve.return_value = self._answers(60, '192.0.2.1')
+        self.assertEqual(self.det.iplist(), ['192.0.2.1'])
+        self.time.monotonic.return_value = 1059.0
+        self.assertEqual(self.det.iplist(), ['192.0.2.1'])
+        self.assertEqual(self.det._rslv.resolve.call_count, 1)
+        self.time.monotonic.return_value = 1061.0
+        self.det._rslv.resolve.return_value = self._answers(60, '192.0.2.2')
+        self.assertEqual(self.det.iplist(), ['192.0.2.2'])
+        self.assertEqual(self.det._rslv.resolve.call_count, 2)
+
+    def test_serve_stale(self):
+        self.det._rslv.resolve.return_value = self._answers(60, '192.0.2.1')
+        self.det.iplist()
+        self.det._rslv.resolve.side_effect = NoAnswer()
+        self.time.monotonic.return_value = 1000.0 + 60 + 3600
+        self.assertEqual(self.det.iplist(), ['192.0.2.1'])
+        self.time.monotonic.return_value = 1000.0 + 60 + self.det.stale_ttl + 1
+        self.assertEqual(self.det.iplist(), [])
+
+    def test_failure_without_cache(self):
+        self.det.fqdns = ['a.example', 'b.example']
+
+        def resolve(fqdn, rdtype):
+            if fqdn == 'b.example':
+                raise NXDOMAIN()
+            return self._answers(60, '192.0.2.1')
+
+        self.det._rslv.resolve.side_effect = resolve
+        self.assertEqual(self.det.iplist(), ['192.0.2.1'])
+
+
+class TestIPSetHandler(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('blocky.blocky.IPSet')
+        self.ipset = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def _existing(self, stype):
+        header = mock.Mock()
+        header.get_attr.return_value = stype
+        self.ipset.headers.return_value = [header]
+
+    def test_set_type_selection(self):
+        self.assertEqual(split_networks(['example.com', '10.0.0.0/8']), (['example.com'], ['10.0.0.0/8']))
+        self.assertEqual(split_networks(['example.com', '10.0.0.1']), (['example.com', '10.0.0.1'], []))
+        self.assertEqual(split_networks(['youtube.com/watch', '::/0']), ([], []))
+        self.assertEqual(IPSetHandler(networks=False).create_ipset_args['stype'], 'hash:ip')
+        handler = IPSetHandler(networks=True)
+        self.assertEqual(handler.create_ipset_args['stype'], 'hash:net')
+        self.assertEqual(handler.etype, 'net')
+
+    def test_create_ipset_missing(self):
+        self.ipset.headers.side_effect = NetlinkError(errno.ENOENT)
+        handler = IPSetHandler(ipset_name='blk')
+        self.assertIsNone(handler.existing_type())
+        handler.create_ipset(None)
+        self.ipset.destroy.assert_not_called()
+        self.ipset.create.assert_called_once_with('blk', stype='hash:ip', hashsize=4096)
+
+    def test_create_ipset_same_type_kept(self):
+        self._existing('hash:ip')
+        self.ipset.create.side_effect = NetlinkError(errno.EEXIST)
+        handler = IPSetHandler(ipset_name='blk')
+        stype = handler.existing_type()
+        self.assertFalse(handler.type_mismatch(stype))
+        handler.create_ipset(stype)
+        self.ipset.destroy.assert_not_called()
+
+    def test_create_ipset_other_type_recreated(self):
+        self._existing('hash:ip')
+        handler = IPSetHandler(ipset_name='blk', networks=True)
+        stype = handler.existing_type()
+        self.assertTrue(handler.type_mismatch(stype))
+        handler.create_ipset(stype)
+        self.ipset.destroy.assert_called_once_with('blk')
+        self.ipset.create.assert_called_once_with('blk', stype='hash:net', hashsize=262144, maxelem=262144)
+
+    def test_stale_rule_dropped_before_recreate(self):
+        self._existing('hash:ip')
+        ipset_handler, iptables_handler = IPSetHandler(ipset_name='blk', networks=True), mock.Mock()
+        BlockManager({}).setup_ipset_and_rule(ipset_handler, iptables_handler)
+        self.assertEqual(self.ipset.headers.call_count, 1)
+        iptables_handler.delete_rule.assert_called_once_with()
+        self.ipset.destroy.assert_called_once_with('blk')
+        iptables_handler.insert_rule.assert_called_once_with()
+
+    def test_update_ipset_diff(self):
+        handler = IPSetHandler(ipset_name='blk')
+        handler.update_ipset(['192.0.2.1', '192.0.2.2'])
+        self.ipset.swap.assert_called_once_with('blk', 'tmp_blk')
+        self.ipset.add.reset_mock()
+        handler.update_ipset(['192.0.2.2', '192.0.2.3'])
+        self.ipset.delete.assert_called_once_with('blk', '192.0.2.1', exclusive=False, etype='ip')
+        self.ipset.add.assert_called_once_with('blk', '192.0.2.3', exclusive=False, etype='ip')
+        self.ipset.reset_mock()
+        handler.update_ipset(['192.0.2.3', '192.0.2.2'])
+        self.ipset.add.assert_not_called()
+        self.ipset.delete.assert_not_called()
+
+    def test_swap_name_fits(self):
+        handler = IPSetHandler(ipset_name='b' * 31)
+        handler.update_ipset(['192.0.2.1'])
+        tmp_name = self.ipset.swap.call_args[0][1]
+        self.assertEqual(len(tmp_name), 31)
+        self.assertNotEqual(tmp_name, handler.ipset_name)
+
+
+class TestIPTablesHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.restored = []
+        self.restore_error = None
+        patcher = mock.patch.object(IPTablesHandler, '_run', autospec=True, side_effect=self._run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, handler, cmds, stdin=None):
+        if cmds[0] == 'iptables-save':
+            return IPTABLES_SAVE
+        if self.restore_error:
+            raise self.restore_error
+        self.restored.append(stdin)
+        return ''
+
+    def test_rules_and_comment(self):
+        th = IPTablesHandler(table_name='FILTER', chain_name='INPUT', ipset_name='blocky')
+        self.assertEqual(len(th.rules()), 3)
+        self.assertEqual(th._rule_comment(th.rules()[0]), None)
+        self.assertEqual(th._rule_comment(th.rules()[1]), 'Blocky Whitelist IPTables Rule')
+        self.assertEqual(th.rule, th.rules()[2])
+
+    def test_delete_rule_by_scan(self):
+        th = IPTablesHandler(table_name='FILTER', chain_name='INPUT', ipset_name='blocky')
+        th.delete_rule()
+        self.assertEqual(self.restored, [
+            '*filter\n-D INPUT -p tcp -m comment --comment "Blocky IPTables Rule" -m set --match-set blocky src '
+            '-j DROP\nCOMMIT\n'])
+
+    def test_insert_and_delete_rule(self):
+        th = IPTablesHandler(table_name='FILTER', chain_name='OUTPUT', ipset_name='blocky', rule_pos=2)
+        th.insert_rule()
+        th.delete_rule()
+        spec = '-p tcp -m comment --comment "Blocky IPTables Rule" -m set --match-set blocky src -j DROP'
+        self.assertEqual(self.restored, ['*filter\n-I OUTPUT 3 {}\nCOMMIT\n'.format(spec),
+                                         '*filter\n-D OUTPUT {}\nCOMMIT\n'.format(spec)])
+
+    def test_delete_inserted_rule_already_gone(self):
+        th = IPTablesHandler(table_name='FILTER', chain_name='OUTPUT', ipset_name='blocky')
+        th.insert_rule()
+        self.restore_error = IPTablesError('Bad rule (does a matching rule exist in that chain?)')
+        th.delete_rule()
+        self.assertIsNone(th.rule)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()